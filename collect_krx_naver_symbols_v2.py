@@ -4,7 +4,7 @@
 # 목적 및 특징:
 #   - 네이버 금융 시가총액 페이지에서 KOSPI, KOSDAQ 상장 종목 코드/이름 수집
 #   - Yahoo Finance 호환 심볼 형식(.KS / .KQ)으로 변환 후 CSV 저장
-#   - requests + BeautifulSoup 기반의 비공식 웹 크롤링
+#   - aiohttp(asyncio 동시 요청) + lxml 기반의 비공식 웹 크롤링
 #
 # 출력:
 #   split_meta_market/
@@ -14,102 +14,140 @@
 # ==========================================================
 
 import re
-import time
 import os
+import asyncio
+import aiohttp
+import numpy as np
 import pandas as pd
-import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
-from bs4 import BeautifulSoup
+import lxml.html
 
 HEADERS = {
     "User-Agent": "Mozilla/5.0",
     "Accept-Language": "ko-KR,ko;q=0.9,en-US;q=0.8,en;q=0.7",
     "Referer": "https://finance.naver.com/",
+    "Accept-Encoding": "gzip, deflate",     # 100~200KB HTML 압축 전송
 }
 BASE_URL = "https://finance.naver.com/sise/sise_market_sum.naver?sosok={market}&page={page}"
 
-def requests_session():
-    s = requests.Session()
-    retries = Retry(
-        total=6, backoff_factor=0.4,
-        status_forcelist=[429, 500, 502, 503, 504],
-        allowed_methods=["GET"],
-        raise_on_status=False,
-    )
-    s.mount("https://", HTTPAdapter(max_retries=retries))
-    s.headers.update(HEADERS)
-    return s
-
-def collect_market(market: int, max_pages: int = 200, sleep_sec: float = 0.15, empty_tolerance: int = 5):
+CONCURRENCY = 16                              # 동시 요청 페이지 수
+MAX_RETRY = 6                                 # 페이지당 재시도 횟수
+RETRY_STATUS = {429, 500, 502, 503, 504}      # 재시도 대상 HTTP 상태
+
+_RE_CODE = re.compile(r"code=(\d{6})")        # 종목코드 추출(페이지 루프 공용)
+# 응답 bytes를 lxml(C)에서 바로 디코딩, 실제 응답은 CP949(euc-kr 상위집합)
+# euc-kr로 지정하면 CP949 전용 글자(예: 똠)에서 libxml2가 파싱을 중단해 이후 행이 조용히 누락됨
+_HTML_PARSER = lxml.html.HTMLParser(encoding="cp949")
+
+def new_session(concurrency: int = CONCURRENCY) -> aiohttp.ClientSession:
+    """keep-alive 커넥션 풀 공용 세션(KOSPI/KOSDAQ 공유), 이벤트 루프 안에서 생성"""
+    connector = aiohttp.TCPConnector(limit=concurrency * 2, limit_per_host=concurrency)
+    return aiohttp.ClientSession(connector=connector, headers=HEADERS)
+
+async def fetch_page(session: aiohttp.ClientSession, sem: asyncio.Semaphore, market: int, page: int, sleep_sec: float = 0.15) -> bytes:
+    """단일 페이지 HTML(CP949 원본 bytes) 요청, 세마포어로 동시 요청 수 제한"""
+    url = BASE_URL.format(market=market, page=page)
+    async with sem:
+        for attempt in range(MAX_RETRY):
+            try:
+                async with session.get(url, timeout=aiohttp.ClientTimeout(total=15)) as resp:
+                    if resp.status in RETRY_STATUS:
+                        raise aiohttp.ClientResponseError(resp.request_info, resp.history, status=resp.status)
+                    html = await resp.read()
+                break
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == MAX_RETRY - 1:
+                    # 빈 페이지로 취급하면 중간 종목이 조용히 누락됨 → 시장 수집 중단
+                    print(f"  ! 페이지 요청 실패: market={market}, page={page} ({e!r})", flush=True)
+                    raise RuntimeError(f"Naver 페이지 요청 실패(market={market}, page={page})") from e
+                await asyncio.sleep(0.4 * (2 ** attempt))
+        await asyncio.sleep(sleep_sec)  # 동시 요청 슬롯별 예의상 간격
+    return html
+
+async def collect_market_async(session: aiohttp.ClientSession, market: int, max_pages: int = 200, sleep_sec: float = 0.15,
+                               empty_tolerance: int = 5, concurrency: int = CONCURRENCY):
     """
+    session: new_session()으로 만든 공용 세션
     market: 0=KOSPI, 1=KOSDAQ
-    정규식으로 code=###### 전부 수집. 연속 empty_tolerance 페이지가 비면 종료.
+    종목명 앵커(a.tltle)에서 코드/이름 수집. 연속 empty_tolerance 페이지가 비면 종료.
+    concurrency 페이지 단위로 묶어 동시 요청 후, 페이지 순서대로 판정
     """
-    sess = requests_session()
     market_name = "KOSPI" if market == 0 else "KOSDAQ"
 
     codes_set = []          # 순서 유지
     code_seen = set()
     code2name = {}
 
+    sem = asyncio.Semaphore(concurrency)
     empty_count = 0
-    for page in range(1, max_pages + 1):
-        url = BASE_URL.format(market=market, page=page)
-        r = sess.get(url, timeout=15)
-        r.encoding = "euc-kr"
-        html = r.text
-
-        # 1) 코드는 정규식으로 전수 수집 (누락 최소화)
-        codes = re.findall(r"code=(\d{6})", html)
-
-        # 2) 이름은 앵커에서만 매핑(있으면 사용)
-        soup = BeautifulSoup(html, "html.parser")
-        for a in soup.select("a.tltle"):
-            href = a.get("href", "")
-            m = re.search(r"code=(\d{6})", href)
-            if not m:
-                continue
-            c = m.group(1)
-            name = (a.get_text() or "").strip()
-            if c and name:
-                code2name[c] = name
-
-        # 페이지가 비었는지 판정
-        unique_new = [c for c in codes if c not in code_seen]
-        if not unique_new:
-            empty_count += 1
-            if empty_count >= empty_tolerance:
-                break
-        else:
-            empty_count = 0
-
-        # 누적
-        for c in unique_new:
-            code_seen.add(c)
-            codes_set.append(c)
-
-        time.sleep(sleep_sec)
+    done = False
+    for batch_start in range(1, max_pages + 1, concurrency):
+        pages = range(batch_start, min(batch_start + concurrency, max_pages + 1))
+        htmls = await asyncio.gather(*(fetch_page(session, sem, market, p, sleep_sec) for p in pages))
+
+        # gather 결과는 요청 순서 보장 → 페이지 순서대로 처리
+        for html in htmls:
+            # 종목명 앵커 1회 파싱으로 코드/이름 동시 추출
+            codes = []
+            anchors = lxml.html.fromstring(html, parser=_HTML_PARSER).xpath("//a[@class='tltle']") if html.strip() else []
+            for a in anchors:
+                m = _RE_CODE.search(a.get("href", ""))
+                if not m:
+                    continue
+                c = m.group(1)
+                codes.append(c)
+                name = a.text_content().strip()
+                if name:
+                    code2name[c] = name
+
+            # 페이지가 비었는지 판정
+            unique_new = [c for c in codes if c not in code_seen]
+            if not unique_new:
+                empty_count += 1
+                if empty_count >= empty_tolerance:
+                    done = True
+                    break
+            else:
+                empty_count = 0
+
+            # 누적
+            for c in unique_new:
+                code_seen.add(c)
+                codes_set.append(c)
+
+        if done:
+            break
 
     # DataFrame 구성
-    df = pd.DataFrame({"종목코드": [c for c in codes_set]})
+    df = pd.DataFrame({"종목코드": codes_set})
     df["시장"] = market_name
     df["종목명"] = df["종목코드"].map(code2name).fillna("")
-    df["YahooSymbol"] = df.apply(
-        lambda x: f"{x['종목코드']}.KS" if x["시장"] == "KOSPI" else f"{x['종목코드']}.KQ",
-        axis=1
-    )
+    suffix = np.where(df["시장"].values == "KOSPI", ".KS", ".KQ")
+    df["YahooSymbol"] = df["종목코드"].astype(str).values + suffix
     df = df.drop_duplicates(subset=["YahooSymbol"]).reset_index(drop=True)
     return df
 
-def main():
-    print("KOSPI 수집...")
-    df_kospi = collect_market(0, max_pages=200, empty_tolerance=5)
-    print(f"  → {len(df_kospi)} rows")
+def collect_market(market: int, max_pages: int = 200, sleep_sec: float = 0.15, empty_tolerance: int = 5):
+    """collect_market_async 동기 래퍼(단일 시장, 자체 세션)"""
+    async def run():
+        async with new_session() as session:
+            return await collect_market_async(session, market, max_pages=max_pages, sleep_sec=sleep_sec,
+                                              empty_tolerance=empty_tolerance)
+    return asyncio.run(run())
+
+async def collect_all():
+    """KOSPI, KOSDAQ 순차 수집, 커넥션 풀은 한 세션으로 재사용"""
+    async with new_session() as session:
+        print("KOSPI 수집...")
+        df_kospi = await collect_market_async(session, 0, max_pages=200, empty_tolerance=5)
+        print(f"  → {len(df_kospi)} rows")
+
+        print("KOSDAQ 수집...")
+        df_kosdaq = await collect_market_async(session, 1, max_pages=240, empty_tolerance=5)
+        print(f"  → {len(df_kosdaq)} rows")
+    return df_kospi, df_kosdaq
 
-    print("KOSDAQ 수집...")
-    df_kosdaq = collect_market(1, max_pages=240, empty_tolerance=5)
-    print(f"  → {len(df_kosdaq)} rows")
+def main():
+    df_kospi, df_kosdaq = asyncio.run(collect_all())
 
     df_total = pd.concat([df_kospi, df_kosdaq], ignore_index=True)
     df_total = df_total.drop_duplicates(subset=["YahooSymbol"]).reset_index(drop=True)
@@ -3,26 +3,37 @@
 # ----------------------------------------------------------
 # 목적:
 #   - 대신증권 Creon API를 이용해 모든 상장 종목의 1분봉 데이터를
-#     최근 2년치(버퍼 1주 포함)까지 자동 수집 및 CSV 저장
+#     최근 2년치(버퍼 1주 포함)까지 자동 수집 및 CSV 저장(pyarrow 설치시 Parquet)
 # 특징:
 #   - 종목코드 저장된 CSV기반으로 동작
 #   - 중간 재시작 가능(체크포인트 기반)
 #   - 일봉 보장 로직 작성
 #   - 수집속도를 포기하고 대신증권 API 호출회수 고려(13회/60s)
+#   - --shard/--shards 로 종목 분할, Creon 로그인(계정/PC)별 병렬 수집
 #
 # 출력:
 #   out_csv/ 아래 {종목코드}_1min_2y.csv 파일 생성
-#   checkpoint.json, 수집 코드 목록과 진행 인덱스 파일(없으면 생성)
+#   (pyarrow 설치된 64bit 환경이면 {종목코드}_1min_2y.parquet, zstd 압축)
+#   codes.json(수집 코드 목록, 목록 변경시만 기록) + progress.json(진행 인덱스)
+#   샤드 실행시 codes_{샤드번호}.json / progress_{샤드번호}.json
 # ==========================================================
 
-import os, re, json, time, datetime as dt
+import os, re, json, time, zlib, argparse, threading, queue, datetime as dt
 from pathlib import Path
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Tuple
 from collections import deque
+import numpy as np
 import pandas as pd
 import win32com.client
 from pywintypes import com_error
 
+# Parquet 저장은 선택(pyarrow는 32bit 윈도우 휠 없음), 없으면 CSV
+try:
+    import pyarrow  # noqa: F401
+    _HAS_PARQUET = True
+except ImportError:
+    _HAS_PARQUET = False
+
 import sys
 if hasattr(sys.stdout, "reconfigure"):
     sys.stdout.reconfigure(line_buffering=True, write_through=True)
@@ -34,11 +45,25 @@ KOSDAQ_CSV = META_DIR / "yahoo_meta_kosdaq.csv"
 
 OUT_DIR = BASE_DIR / "out_csv"
 OUT_DIR.mkdir(exist_ok=True)
+OUT_EXT = "parquet" if _HAS_PARQUET else "csv"  # 출력 형식(시작시 1회 결정)
 _REQ_TS = deque()  # type: deque
 _MAX_CALLS = 13
 _WINDOW_SEC = 60.0
 
-CHECKPOINT = BASE_DIR / "checkpoint.json"
+CP_CODES = BASE_DIR / "codes.json"          # 체크포인트: 수집 코드 목록(불변)
+CP_PROGRESS = BASE_DIR / "progress.json"    # 체크포인트: 진행 인덱스
+CHECKPOINT = BASE_DIR / "checkpoint.json"   # 구버전 체크포인트(index+codes), 읽기 전용
+_CP_EVERY = 10                              # 스킵 구간 진행 인덱스 기록 간격(종목)
+VALID_CACHE = BASE_DIR / "valid_cache.json"   # 종목 유효성(check_stock) 캐시
+_VALID_CACHE_DAYS = 7                          # 캐시 유효기간(일), 경과시 재검증
+
+# 분봉 응답 필드 순서(SetInputValue(5, ...) 순서와 동일) 및 dtype(시각 HHMM은 int16으로 충분)
+_CHUNK_DTYPES = [
+    ("date", np.int32), ("time", np.int16),
+    ("open", np.int32), ("high", np.int32), ("low", np.int32), ("close", np.int32),
+    ("volume", np.int64),
+]
+_OUT_DTYPES = dict(_CHUNK_DTYPES)   # 저장 dtype(수집 dtype과 동일)
 # ----------------- 경로 설정-END------------------
 
 # ----------------- Cybos 객체 -----------------@대신증권
@@ -46,21 +71,65 @@ cy = win32com.client.Dispatch("CpUtil.CpCybos")
 if cy.IsConnect == 0:
     raise SystemExit("Cybos 미연결: 보라색 아이콘, 관리자권한을 확인하세요.")
 codemgr = win32com.client.Dispatch("CpUtil.CpCodeMgr")
+# 분봉 요청 객체는 1회 생성 후 재사용(요청마다 Dispatch 비용 제거)
+# early-binding(gencache) 가능하면 사용, 실패시 late-binding
+try:
+    _SC = win32com.client.gencache.EnsureDispatch("CpSysDib.StockChart")
+except Exception:
+    _SC = win32com.client.Dispatch("CpSysDib.StockChart")
 
 
 # -----------------체크포인트---------------------
-def load_cp() -> Dict:
-    """마지막 세이브 포인트에서 재시작"""
-    if CHECKPOINT.exists():
+def cp_paths(shard_id: int = 0, n_shards: int = 1) -> Tuple[Path, Path]:
+    """샤드별 체크포인트 경로(codes, progress), 단일 실행(n_shards=1)은 codes.json/progress.json"""
+    if n_shards <= 1:
+        return CP_CODES, CP_PROGRESS
+    return BASE_DIR / f"codes_{shard_id}.json", BASE_DIR / f"progress_{shard_id}.json"
+
+def _write_atomic(path: Path, text: str):
+    """임시파일 기록 후 교체(fsync 생략, 중단시 반쪽 파일만 방지), 임시파일은 프로세스별(샤드 공유 디렉터리 대비)"""
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, path)
+
+def load_cp(codes_path: Path = CP_CODES, progress_path: Path = CP_PROGRESS) -> Dict:
+    """마지막 세이브 포인트에서 재시작, 없으면 구버전 checkpoint.json 참조"""
+    try:
+        codes = json.loads(codes_path.read_text(encoding="utf-8"))
+        idx = json.loads(progress_path.read_text(encoding="utf-8"))["index"]
+        return {"index": idx, "codes": codes}
+    except Exception:
+        pass
+    if codes_path == CP_CODES and CHECKPOINT.exists():
         try:
             return json.loads(CHECKPOINT.read_text(encoding="utf-8"))
         except Exception:
             pass
     return {"index": 0, "codes": []}
 
-def save_cp(idx: int, codes: List[str]):
-    """현재 진행 인덱스, 잔여 코드 json 저장"""
-    CHECKPOINT.write_text(json.dumps({"index": idx, "codes": codes}, ensure_ascii=False), encoding="utf-8")
+def save_codes(codes: List[str], path: Path = CP_CODES):
+    """수집 코드 목록 json 저장(목록이 바뀔 때만 호출)"""
+    _write_atomic(path, json.dumps(codes, ensure_ascii=False))
+
+def save_progress(idx: int, path: Path = CP_PROGRESS):
+    """현재 진행 인덱스 json 저장"""
+    _write_atomic(path, json.dumps({"index": idx}))
+
+def load_valid_cache() -> Dict:
+    """종목 유효성 캐시 로드, 유효기간 경과/손상시 새 캐시"""
+    if VALID_CACHE.exists():
+        try:
+            blob = json.loads(VALID_CACHE.read_text(encoding="utf-8"))
+            created = dt.date.fromisoformat(blob["created"])
+            if (dt.date.today() - created).days < _VALID_CACHE_DAYS:
+                return blob
+        except Exception:
+            pass
+    return {"created": dt.date.today().isoformat(), "codes": {}}
+
+def save_valid_cache(blob: Dict):
+    """종목 유효성 캐시 저장 {created: YYYY-MM-DD, codes: {code: bool}}"""
+    _write_atomic(VALID_CACHE, json.dumps(blob))
 
 # -----------------체크포인트-END -----------------
 
@@ -81,15 +150,15 @@ def to_creon_code(raw: str) -> Optional[str]:
         return None
     return "A" + digits.zfill(6)
 
-def is_valid_stock(creon_code: str) -> bool:
-    """대신증권에 존재 여부 확인"""
+def check_stock(creon_code: str) -> Optional[bool]:
+    """대신증권에 존재 여부 확인, COM 오류시 None(판정 불가)"""
     try:
         #@대신증권
         sec = codemgr.GetStockSectionKind(creon_code)  # 1: 주식
         mkt = codemgr.GetStockMarketKind(creon_code)   # 1: KOSPI, 2: KOSDAQ
         return (sec == 1) and (mkt in (1, 2))
     except Exception:
-        return False
+        return None
 
 def load_codes_from_csv(path: Path) -> List[str]:
     """주식 메타정보csv에서 주식코드 추출"""
@@ -98,13 +167,30 @@ def load_codes_from_csv(path: Path) -> List[str]:
     df = pd.read_csv(path)
     cand = [c for c in ["code","Code","symbol","Symbol","ticker","Ticker"] if c in df.columns]
     series = df[cand[0]] if cand else df.iloc[:, 0]
+    # 이미 수집 완료된 종목은 검증(COM 호출) 생략
+    done = {p.name.split("_")[0] for ext in ("parquet", "csv") for p in OUT_DIR.glob(f"A*_1min_2y.{ext}")}
+    vc = load_valid_cache()
+    cache = vc["codes"]
+    n_cached = len(cache)
     out = []
     for x in series.tolist():
         c = to_creon_code(x)
-        if c and is_valid_stock(c):
+        if not c:
+            continue
+        if c in done:
+            out.append(c)
+            continue
+        valid = cache.get(c)
+        if valid is None:
+            valid = check_stock(c)
+            if valid is not None:   # 실제 판정만 캐시(일시적 COM 오류는 다음 실행에서 재확인)
+                cache[c] = valid
+        if valid:
             out.append(c)
-    # 중복 제거 & 정렬
-    return sorted(set(out))
+    if len(cache) != n_cached:
+        save_valid_cache(vc)
+    # 중복 제거(CSV 순서 유지, 정렬 생략)
+    return list(dict.fromkeys(out))
 
 def is_minute_df(df: pd.DataFrame) -> bool:
     """종가 시간 빈도로 분봉여부 판별"""
@@ -128,6 +214,17 @@ def month_chunks(start_date: dt.date, end_date: dt.date):
         yield s, e      #파이썬 제너레이터, 반복 반환
         cur = nxt
 
+def ymd(d: dt.date) -> int:
+    """date -> YYYYMMDD 정수"""
+    return int(d.strftime("%Y%m%d"))
+
+# 수집 구간은 프로세스 시작일 기준 1회 계산(종목 공통, 자정 넘어가도 구간 고정)
+_TODAY = dt.date.today()
+_START = _TODAY - dt.timedelta(days=365*2 + 7)  # 버퍼 1주
+_END   = _TODAY - dt.timedelta(days=1)          # 당일 제외
+# (ymd_from, ymd_to, s, e) 월 단위 요청 구간
+_MONTH_YMD = [(ymd(s), ymd(e), s, e) for s, e in month_chunks(_START, _END)]
+
 def rate_limit_wait():
     """
     _REQ_TS: deque -> 최근 호출 타임스탬프(초)
@@ -169,9 +266,9 @@ def rate_limit_wait():
 
 def request_minute_chunk(code: str, ymd_from: int, ymd_to: int, max_retry: int = 3) -> pd.DataFrame:
     """[ymd_from, ymd_to] 구간 1분봉 요청, 기대응답 아닐시 max_retry 만큼 재시도"""
+    sc = _SC    # 입력값은 매 요청마다 전부 덮어씀
     for r in range(max_retry):
         #@대신증권
-        sc = win32com.client.Dispatch("CpSysDib.StockChart")
         # 입력 순서 고정(중요)
         sc.SetInputValue(0, code)                 # 종목
         sc.SetInputValue(1, ord('2'))             # 기간 기반
@@ -196,18 +293,12 @@ def request_minute_chunk(code: str, ymd_from: int, ymd_to: int, max_retry: int =
             time.sleep(0.4 + 0.3*r)
             continue
 
-        rows = []
-        for i in range(cnt):
-            rows.append([
-                sc.GetDataValue(0,i),  # date
-                sc.GetDataValue(1,i),  # time
-                sc.GetDataValue(2,i),  # open
-                sc.GetDataValue(3,i),  # high
-                sc.GetDataValue(4,i),  # low
-                sc.GetDataValue(5,i),  # close
-                sc.GetDataValue(6,i),  # volume
-            ])
-        df = pd.DataFrame(rows, columns=["date","time","open","high","low","close","volume"])
+        # 필드(열) 단위로 최종 dtype 배열에 바로 수집(중간 리스트/int64 추론 생략)
+        get = sc.GetDataValue
+        df = pd.DataFrame({
+            name: np.fromiter((get(f, i) for i in range(cnt)), dtype=dtype, count=cnt)
+            for f, (name, dtype) in enumerate(_CHUNK_DTYPES)
+        }, copy=False)
 
         if is_minute_df(df):
             return df
@@ -219,19 +310,12 @@ def request_minute_chunk(code: str, ymd_from: int, ymd_to: int, max_retry: int =
     return pd.DataFrame(columns=["date","time","open","high","low","close","volume"])
 
 def collect_1min_2years(code: str) -> pd.DataFrame:
-    """1분봉 2년치 수집"""
-    today = dt.date.today()
-
-    start = today - dt.timedelta(days=365*2 + 7)  # 버퍼 1주
-    end   = today - dt.timedelta(days=1)          # 당일 제외
-
+    """1분봉 2년치 수집, 구간은 _MONTH_YMD(프로세스 시작일 기준)"""
     out = []
-    
-    ymd = lambda d: int(d.strftime("%Y%m%d"))   #포매팅 람다함수 선언
 
     #분봉 결과 보장을 위해 월->반월->일 단위 순차요청
-    for s, e in month_chunks(start, end):
-        df = request_minute_chunk(code, ymd(s), ymd(e))
+    for ymd_s, ymd_e, s, e in _MONTH_YMD:
+        df = request_minute_chunk(code, ymd_s, ymd_e)
         if df.empty:
             # 반월 분해
             mid = s + (e - s)/2
@@ -256,55 +340,143 @@ def collect_1min_2years(code: str) -> pd.DataFrame:
         return pd.DataFrame(columns=["date","time","open","high","low","close","volume"])
 
     df_all = pd.concat(out, ignore_index=True)
-    # time 유지(분봉 보존) + 정렬 + 중복 제거
-    df_all["time"] = df_all["time"].astype(int)
-    df_all = df_all.sort_values(["date","time"]).drop_duplicates(subset=["date","time"])
+    # time 유지(분봉 보존) + 정렬 + 중복 제거: YYYYMMDDHHMM 정수키 1개로 stable 정렬 후 인접 중복 제거
+    key = df_all["date"].values.astype(np.int64) * 10000 + df_all["time"].values.astype(np.int64)
+    order = np.argsort(key, kind="stable")
+    key = key[order]
+    keep = np.r_[True, np.diff(key) != 0]
+    df_all = df_all.iloc[order[keep]].reset_index(drop=True)
     return df_all[["date","time","open","high","low","close","volume"]]
 
 # ----------------- 유틸-END -----------------
 
+# ----------------- 파일 저장(백그라운드) -------------
+_WRITE_Q = queue.Queue(maxsize=4)  # type: queue.Queue  # (code, out_path, df), 메모리 상한용 maxsize
+_DONE_Q = queue.Queue()            # type: queue.Queue  # (code, rows, 에러|None), 저장 결과 → 메인 스레드
+
+def _writer_loop():
+    """저장 전용 스레드: 큐에서 꺼내 임시파일 기록 후 교체(중단시 반쪽 파일 방지), 결과는 _DONE_Q로 보고"""
+    while True:
+        code, path, df = _WRITE_Q.get()
+        try:
+            tmp = path.with_name(path.name + ".tmp")
+            df = df.astype(_OUT_DTYPES)
+            if _HAS_PARQUET:
+                df.to_parquet(tmp, engine="pyarrow", index=False, compression="zstd", compression_level=3)
+            else:
+                df.to_csv(tmp, index=False)
+            os.replace(tmp, path)
+            _DONE_Q.put((code, len(df), None))
+        except Exception as e:
+            _DONE_Q.put((code, len(df), e))
+        finally:
+            _WRITE_Q.task_done()
+
+def report_writes(failed: List[str]):
+    """저장 결과 출력(메인 스레드 전용, 출력 섞임 방지), 실패 코드는 failed에 누적"""
+    while True:
+        try:
+            code, rows, err = _DONE_Q.get_nowait()
+        except queue.Empty:
+            return
+        if err is None:
+            print(f"saved {rows} rows ({code})", flush=True)
+        else:
+            print(f" WRITE FAILED {code} ({err})", flush=True)
+            failed.append(code)
+
+def start_writer() -> threading.Thread:
+    """수집 루프가 디스크 I/O를 기다리지 않도록 저장 스레드 시작"""
+    t = threading.Thread(target=_writer_loop, daemon=True)
+    t.start()
+    return t
+
+# ----------------- 파일 저장(백그라운드)-END ----------
+
 # ----------------- 메인 ---------------------
-def main():
+def main(shard_id: int = 0, n_shards: int = 1):
+    """
+    shard_id/n_shards: crc32(종목코드) % n_shards == shard_id 인 종목만 수집
+    (목록 위치가 아닌 코드 해시 기준 → PC마다 목록이 조금 달라도 샤드 배정 불변,
+     끝자리=주식 종류라 코드 숫자 그대로 나누면 보통주가 한 샤드에 몰림)
+    Creon 로그인(계정/PC)마다 샤드 하나씩 실행, 샤드별 체크포인트 사용
+    """
     kospi = load_codes_from_csv(KOSPI_CSV)
     kosdaq = load_codes_from_csv(KOSDAQ_CSV)
-    codes_all = sorted(set(kospi + kosdaq))  # List[str]
+    codes_all = list(dict.fromkeys(kospi + kosdaq))  # List[str], KOSPI→KOSDAQ CSV 순서
+    codes_all = [c for c in codes_all if zlib.crc32(c.encode()) % n_shards == shard_id]
 
-    cp = load_cp()
+    codes_file, progress_file = cp_paths(shard_id, n_shards)
+    cp = load_cp(codes_file, progress_file)
     if cp.get("codes") != codes_all:
         cp = {"index": 0, "codes": codes_all}
+        save_codes(codes_all, codes_file)
+        save_progress(0, progress_file)     # 이전 목록의 인덱스가 새 목록에 남지 않도록 함께 초기화
+    elif not codes_file.exists():
+        save_codes(codes_all, codes_file)   # 구버전 checkpoint.json에서 이어받은 경우
 
     start_idx = int(cp["index"])
-    print(f"총 {len(codes_all)}개, {start_idx+1}번째부터 시작")
-
-    for i in range(start_idx, len(codes_all)):
-        code = codes_all[i]
-        name = codemgr.CodeToName(code)
-        out_path = OUT_DIR / f"{code}_1min_2y.csv"
+    tag = f"[shard {shard_id}/{n_shards}] " if n_shards > 1 else ""
+    print(f"{tag}총 {len(codes_all)}개, {start_idx+1}번째부터 시작 (저장 형식: {OUT_EXT})")
 
-        try:
-            # 이미 완료된 파일은 스킵
-            if out_path.exists() and out_path.stat().st_size > 0:
-                print(f"[{i+1}/{len(codes_all)}] {code} {name} -> exists, skip")
-                save_cp(i+1, codes_all)
-                continue
-
-            print(f"[{i+1}/{len(codes_all)}] {code} {name} -> collecting...", flush=True)
-            save_cp(i+1, codes_all)
-            #수집로직
-            df = collect_1min_2years(code)
-
-            if df.empty:
-                print(" empty")
-            else:
-                df.to_csv(out_path, index=False)
-                print(f"saved {len(df)} rows", flush=True)
-
-        except Exception as e:
-            print(f" FAILED ({e})")
-
-        time.sleep(0.15)
+    start_writer()  # 저장은 _WRITE_Q로 넘기고 바로 다음 종목 진행
+    next_idx = saved_idx = start_idx
+    failed = []     # 저장 실패 코드, 다음 실행에서 재수집
+    try:
+        for i in range(start_idx, len(codes_all)):
+            report_writes(failed)
+            if failed:
+                print(" 저장 실패 → 수집 중단")
+                break
+            code = codes_all[i]
+            name = codemgr.CodeToName(code)
+            out_path = OUT_DIR / f"{code}_1min_2y.{OUT_EXT}"
+
+            try:
+                # 이미 완료된 파일은 스킵(CSV/Parquet 어느 쪽이든)
+                if any(p.exists() and p.stat().st_size > 0 for p in (out_path.with_suffix(".csv"), out_path.with_suffix(".parquet"))):
+                    print(f"[{i+1}/{len(codes_all)}] {code} {name} -> exists, skip")
+                    next_idx = i+1
+                    if next_idx - saved_idx >= _CP_EVERY:
+                        save_progress(next_idx, progress_file)
+                        saved_idx = next_idx
+                    continue
+
+                print(f"[{i+1}/{len(codes_all)}] {code} {name} -> collecting...", flush=True)
+                # 수집 전 항상 기록: 타임아웃 재시작시 멈춘 종목을 건너뛰기 위함
+                next_idx = saved_idx = i+1
+                save_progress(next_idx, progress_file)
+                #수집로직
+                df = collect_1min_2years(code)
+
+                if df.empty:
+                    print(" empty")
+                else:
+                    _WRITE_Q.put((code, out_path, df))
+                    print(f"collected {len(df)} rows, write queued", flush=True)
+
+            except Exception as e:
+                print(f" FAILED ({e})")
+
+            time.sleep(0.15)
+    finally:
+        _WRITE_Q.join()     # 남은 저장 완료 대기 후 종료
+        report_writes(failed)
+        if failed:
+            # 저장 실패 종목부터 다시 시작(그 뒤 완료 종목은 파일 존재로 스킵)
+            next_idx = min(codes_all.index(c) for c in failed)
+        if next_idx != saved_idx:
+            save_progress(next_idx, progress_file)
+    if failed:
+        raise SystemExit(f"저장 실패 {len(failed)}건: {', '.join(failed)} → 재실행시 재수집")
 
 # ----------------- 메인-END------------------
 
 if __name__ == "__main__":
-    main()
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--shard", type=int, default=0, help="담당 샤드 번호(0부터)")
+    ap.add_argument("--shards", type=int, default=1, help="전체 샤드 수(Creon 로그인 수)")
+    args = ap.parse_args()
+    if not (0 <= args.shard < args.shards):
+        raise SystemExit(f"잘못된 샤드 지정: --shard {args.shard} --shards {args.shards}")
+    main(args.shard, args.shards)
@@ -6,9 +6,10 @@
 #   - 비블로킹 로그 스트림을 통해 진행 상태 추적 및 타임아웃 감지
 #
 # 특징:
-#   - subprocess.Popen으로 자식 프로세스 생성 (CREON 수집 프로세스)
-#   - 전용 스레드(reader_thread)로 stdout을 실시간 큐(queue)에 적재
-#   - 메인 스레드는 로그를 소비하며 상태머신 방식으로 진행 관리
+#   - asyncio.create_subprocess_exec로 자식 프로세스 생성 (CREON 수집 프로세스)
+#   - stdout 파이프를 이벤트 루프에서 직접 readline (별도 스레드/큐 없음)
+#   - 타임아웃 마감 시각까지만 readline 대기(폴링 없음, monotonic 시계 기준)
+#   - 로그를 소비하며 상태머신 방식으로 진행 관리
 #   - “-> collecting…” 이후 TIMEOUT_SEC 동안 “saved N rows” 미출력 시 타임아웃 판정
 #   - 타임아웃 발생 시 자식 프로세스 kill 후 재시작
 #   - KeyboardInterrupt 시 전체 종료 (정상종료는 collect_stock.py 내부 처리)
@@ -18,31 +19,36 @@
 #   - 타임아웃 시 "[TIMEOUT]" 로그, 정상 종료 시 "[OK]" 로그 표시
 # ==========================================================
 
-import os, sys, time, threading, queue, subprocess, signal, re
+import os, sys, time, asyncio, subprocess, signal, re
 from pathlib import Path
 
 SCRIPT = "collect_stock.py"   # 감시 대상 스크립트 파일명 (collect_stock.py)
+SCRIPT_ARGS = sys.argv[1:]    # 감시 대상에 그대로 전달할 인자 (예: --shard 0 --shards 2)
 TIMEOUT_SEC = 240             # collecting 이후 최대 무응답 허용 시간(s)
 RETRY_DELAY = 15              # 재시작 전 대기 시간
 MAX_RESTARTS = 0              # 재시작 한도 (0이면 무제한)
 
-# 진행 상태를 판별하기 위한 출력 패턴
-RE_STARTLINE  = re.compile(r"^\[\s*\d+\s*/\s*\d+\s*\]")           # “[ 134 / 2677 ] ...” 형태 감지 (새 종목 시작)
-RE_COLLECTING = re.compile(r"->\s*collecting", re.IGNORECASE)# “-> collecting...” 라인 감지
-
-RE_SAVED      = re.compile(r"\bsaved\s+\d[\d,]*\s+rows\b", re.IGNORECASE)# “saved N rows” 감지
-RE_SAVED_ROWS = re.compile(r"saved\s+(\d+)\s+rows", re.IGNORECASE) # “saved 72161 rows”에서 저장된 행 수 추출
+# 진행 상태를 판별하기 위한 출력 패턴(단일 정규식, 라인당 1회 스캔)
+#   start   : “[ 134 / 2677 ] A000020 ...” 형태 감지 (새 종목 시작, 종목코드 ccode)
+#   collect : “-> collecting...” 라인 감지
+#   saved   : “saved 72161 rows (A000020)” 감지 및 저장된 행 수(rows), 종목코드(scode) 추출
+RE_EVENT = re.compile(
+    r"(?P<start>^\[\s*\d+\s*/\s*\d+\s*\]\s*(?P<ccode>A\d{6})?)"
+    r"|(?P<collect>->\s*collecting)"
+    r"|(?P<saved>\bsaved\s+(?P<rows>\d[\d,]*)\s+rows\b(?:\s*\((?P<scode>A\d{6})\))?)",
+    re.IGNORECASE,
+)
 
 # ----- 유틸 -----------
 def kill_process(proc):
     """자식 프로세스를 안전하게 종료"""
-    if proc.poll() is not None:
+    if proc.returncode is not None:
         return  # 이미 종료됨
     try:
         if os.name == "nt":
             proc.send_signal(signal.CTRL_BREAK_EVENT)  # 소프트 종료 시도
             time.sleep(1.0)
-            proc.kill()                                # 그래도 살아있으면 강제 종료
+        proc.kill()                                    # 그래도 살아있으면 강제 종료
     except Exception:
         # 어떤 예외가 나더라도 최후의 시도로 kill
         try:
@@ -50,17 +56,9 @@ def kill_process(proc):
         except Exception:
             pass
 
-def reader_thread(proc, q: queue.Queue):
-    """자식 프로세스 stdout 처리할 runner_watch 소비 큐"""
-    try:
-        for line in iter(proc.stdout.readline, ""):
-            q.put(line)
-    finally:
-        q.put(None)  # 출력 종료(프로세스 종료) 표시
-
 # ----- 유틸-END--------
 
-def spawn_process():
+async def spawn_process():
     """자식 프로세스 생성 및 출력 파이프 설정"""
     env = os.environ.copy()
     env["PYTHONUNBUFFERED"] = "1"   # 자식 프로세스 stdout 버퍼링 최소화(라인 실시간 전달)
@@ -71,53 +69,53 @@ def spawn_process():
     if os.name == "nt":
         creationflags = subprocess.CREATE_NEW_PROCESS_GROUP
 
-    return subprocess.Popen(
-        [sys.executable, "-u", SCRIPT],
-        stdout=subprocess.PIPE,          # 표준출력을 파이프로
-        stderr=subprocess.STDOUT,        # stderr도 합쳐서 단일 스트림으로
-        bufsize=1,                       # line-buffered
-        universal_newlines=True,         # 텍스트 모드(줄 단위 처리)
-        encoding="utf-8",                # 인코딩 설정 강제(보완용)
-        errors="replace",
+    return await asyncio.create_subprocess_exec(
+        sys.executable, "-u", SCRIPT, *SCRIPT_ARGS,
+        stdout=asyncio.subprocess.PIPE,  # 표준출력을 파이프로
+        stderr=asyncio.subprocess.STDOUT,# stderr도 합쳐서 단일 스트림으로
         env=env,
         creationflags=creationflags
     )
 
-def main():
+async def main():
     restarts = 0
 
     while True:
         print(f"[RUN] {SCRIPT} 시작 (타임아웃 {TIMEOUT_SEC//60}분)")
         
         # === 파이프 생성 및 프로세스 실행  ===
-        proc = spawn_process()
-        q: queue.Queue[str | None] = queue.Queue()
-        t = threading.Thread(target=reader_thread, args=(proc, q), daemon=True)
-        t.start()
+        proc = await spawn_process()
 
-        # === STDOUT 담은 소비 큐 기준 처리  ===
+        # === STDOUT 라인 단위 처리  ===
 
         in_progress = False
+        collect_start_ts = None
+        current_code = None         # 현재 수집 중 종목코드
         exited_normally = False     #runnser_watch 종료 플래그
 
         while True:
 
             try:
-                # 큐 수집( per 1s )
+                # 수집 중이면 타임아웃 마감까지만, 아니면 다음 라인까지 대기
+                wait_sec = None
+                if in_progress and collect_start_ts is not None:
+                    wait_sec = max(0.0, collect_start_ts + TIMEOUT_SEC - time.monotonic())
                 try:
-                    item = q.get(timeout=1.0)
-                except queue.Empty:
-                    item = ""
+                    raw = await asyncio.wait_for(proc.stdout.readline(), timeout=wait_sec)
+                except asyncio.TimeoutError:
+                    raw = None
 
-                now = time.time()
+                now = time.monotonic()     # 타이머 전용(시스템 시계 보정 영향 없음)
 
                 # 자식 프로세스 EOF시 종료
-                if item is None:
-                    proc.wait(timeout=3)
+                if raw == b"":
+                    await asyncio.wait_for(proc.wait(), timeout=3)
                     exited_normally = (proc.returncode == 0)
                     break
 
-                if item:
+                if raw:
+                    item = raw.decode("utf-8", errors="replace").replace("\r\n", "\n")
+
                     # 자식 프로세스 콘솔 중계
                     sys.stdout.write(item)
                     sys.stdout.flush()
@@ -125,22 +123,27 @@ def main():
                     current = now
                     ts = time.strftime("%H:%M:%S")
 
+                    # 한 라인에 시작+collecting이 같이 올 수 있어 매치 전부 수집
+                    events = {m.lastgroup: m for m in RE_EVENT.finditer(item)}
+
                     # 디버깅용 시작 플래그 탐색(“[ 134 / 2677 ] ...”), 타이머 x
-                    if RE_STARTLINE.search(item):
+                    if "start" in events:
+                        current_code = events["start"].group("ccode")
                         collect_start_ts = current
                         in_progress = False
                         print(f"[DBG {ts}] startline detected; timer armed", file=sys.stderr, flush=True)
 
                     # 'saved' 우선 판정
-                    has_saved   = RE_SAVED.search(item) is not None
-                    has_collect = RE_COLLECTING.search(item) is not None
+                    # 저장은 백그라운드라 이전 종목 saved가 늦게 올 수 있음 → 현재 종목 것만 인정
+                    saved_code = events["saved"].group("scode") if "saved" in events else None
+                    has_saved   = "saved" in events and (saved_code is None or saved_code == current_code)
+                    has_collect = "collect" in events
 
                     # 종료 플래그 탐색(“saved N rows”)
                     if has_saved:
                         in_progress = False
                         collect_start_ts = None
-                        m_rows = RE_SAVED_ROWS.search(item)
-                        rows = m_rows.group(1) if m_rows else "?"
+                        rows = events["saved"].group("rows")
                         elapsed = (current - collect_start_ts) if collect_start_ts else 0.0
                         print(f"[DBG {ts}] saved detected; rows={rows}, elapsed={elapsed:.1f}s", file=sys.stderr, flush=True)
                     # 시작 플래그 탐색(“-> collecting...”)
@@ -151,18 +154,13 @@ def main():
 
                 # 타임아웃 판정: collecting 이후 TIMEOUT_SEC 동안 'saved'가 안 오면 재시작
                 if in_progress and collect_start_ts is not None:
-                    if now - collect_start_ts > TIMEOUT_SEC:
+                    if now - collect_start_ts >= TIMEOUT_SEC:
                         print(f"[TIMEOUT] {TIMEOUT_SEC//60}분 무응답 → 프로세스 재시작")
                         kill_process(proc)
+                        await proc.wait()
                         break
 
-
-                # 자발 종료(정상/비정상) 감지
-                if proc.poll() is not None:
-                    exited_normally = (proc.returncode == 0)
-                    break
-
-            except KeyboardInterrupt:
+            except (KeyboardInterrupt, asyncio.CancelledError):
                 # 사용자가 runner 자체를 중단
                 print("\n[STOP] 사용자 중단")
                 kill_process(proc)
@@ -171,6 +169,7 @@ def main():
                 # runner 자체 예외: 자식 정리 후 재시작 루프로 복귀
                 print(f"[ERROR] runner 예외: {e}")
                 kill_process(proc)
+                await proc.wait()
                 break
 
         # === 실행 종료 후 처리 ===
@@ -187,7 +186,10 @@ def main():
 
         # 재시작 대기 및 루프 계속
         print(f"[RESTART] {RETRY_DELAY}s 후 재시작 (누적 {restarts})")
-        time.sleep(RETRY_DELAY)
+        await asyncio.sleep(RETRY_DELAY)
 
 if __name__ == "__main__":
-    main()
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass    # 자식 정리는 main() 내부에서 처리